@@ -1,12 +1,29 @@
 import os
 import re
-import json
+import sys
 import time
+import hashlib
+import calendar
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+import orjson
+import diskcache
 import requests
-from flask import Flask, request, render_template
-from markupsafe import Markup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from flask import Flask, Response, request, render_template, stream_with_context
+from redis import Redis
+from rq import Queue
+from rq.exceptions import NoSuchJobError
+from rq.job import Job
+from markupsafe import Markup, escape
 from openai import OpenAI
+from cachetools import TTLCache
+from lxml import html as lxml_html
+from lxml_html_clean import Cleaner
 
 # ---------- Configuration (use env vars in production) ----------
 SERPAPI_KEY = os.getenv("SERPAPI_KEY", "REPLACE_WITH_YOUR_SERPAPI_KEY")
@@ -14,83 +31,195 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "REPLACE_WITH_YOUR_OPENAI_KEY")
 
 DEFAULT_PAGES = int(os.getenv("PAGES", "2"))   # server-side pagination: pages (1–5)
 DEFAULT_NUM   = int(os.getenv("NUM", "40"))    # results per page (1–100)
+MAX_PAGES     = 5
+MAX_NUM       = 100
+MAX_KEYWORDS  = int(os.getenv("MAX_KEYWORDS", "5"))  # keywords per /generate (separated by ";")
+FETCH_WORKERS = int(os.getenv("FETCH_WORKERS", "16"))  # SerpAPI page fetchers shared per process
+
+SERP_CACHE_DIR = os.getenv("SERP_CACHE_DIR", os.path.join(tempfile.gettempdir(), "company-radar"))
+SERP_CACHE_TTL = int(os.getenv("SERP_CACHE_TTL", "900"))  # seconds; raw SerpAPI pages
+SERP_TIMEOUT   = 25  # seconds per SerpAPI attempt
+SERP_RETRIES   = 2   # extra attempts on connection errors / 502-504
+
+# Background jobs: with REDIS_URL set, /generate enqueues to RQ and the page polls
+# /result/<job_id>; without it, requests run synchronously (single-user dev mode).
+REDIS_URL = os.getenv("REDIS_URL", "")
+JOB_TTL   = int(os.getenv("JOB_RESULT_TTL", "600"))  # seconds a finished result stays fetchable
+# Plain cap on one background job, not a worst-case bound: a slow or retrying
+# OpenAI call can push a 5-keyword job past it, and RQ then marks it failed.
+JOB_TIMEOUT = int(os.getenv("JOB_TIMEOUT", "600"))  # seconds
+
+LLM_MODEL            = os.getenv("LLM_MODEL", "gpt-5")
+LLM_SMALL_MODEL      = os.getenv("LLM_SMALL_MODEL", "gpt-5-mini")
+LLM_SMALL_MAX_TOKENS = int(os.getenv("LLM_SMALL_MAX_TOKENS", "2000"))  # below this, use LLM_SMALL_MODEL (0 = never)
+LLM_TIMEOUT          = float(os.getenv("LLM_TIMEOUT", "110"))    # seconds; keep under gunicorn --timeout
+LLM_CACHE_SIZE       = int(os.getenv("LLM_CACHE_SIZE", "512"))   # cached <ul> fragments per worker
+LLM_CACHE_TTL        = int(os.getenv("LLM_CACHE_TTL", "3600"))   # seconds
+LLM_DIRECT_MAX_ITEMS = int(os.getenv("LLM_DIRECT_MAX_ITEMS", "2"))  # this many items or fewer skip the LLM
+LLM_RETRIES          = 2   # the OpenAI client's own retries (its default, made explicit)
+
+EMBED_MODEL         = os.getenv("EMBED_MODEL", "text-embedding-3-small")
+EMBED_TIMEOUT       = float(os.getenv("EMBED_TIMEOUT", "5"))   # seconds; no retries, a miss is cheap
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "256"))
+SEMANTIC_MIN_SIM    = float(os.getenv("SEMANTIC_MIN_SIM", "0.95"))     # keyword cosine similarity
+SEMANTIC_MIN_JACC   = float(os.getenv("SEMANTIC_MIN_JACCARD", "0.8"))  # URL-set overlap
 
 app = Flask(__name__)
 
+# Long-lived clients so SerpAPI and OpenAI calls reuse pooled TLS connections
+# across requests. requests makes no thread-safety guarantee for a shared
+# Session, so each thread (in practice each FETCH_POOL thread, which lives for the
+# process) gets its own. The OpenAI client keeps no per-request state and is
+# shared; its connections come from one httpx pool. Sockets open lazily, so
+# nothing is connected before gunicorn forks (--preload).
+_session_local = threading.local()
+
+def http_session() -> requests.Session:
+    session = getattr(_session_local, "session", None)
+    if session is None:
+        session = _session_local.session = requests.Session()
+        session.mount("https://", HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=1,
+            max_retries=Retry(total=SERP_RETRIES, backoff_factor=0.2, status_forcelist=(502, 503, 504),
+                              raise_on_status=False),
+        ))
+    return session
+
+OAI = OpenAI(api_key=OPENAI_API_KEY, timeout=LLM_TIMEOUT, max_retries=LLM_RETRIES)
+
+# One process-wide pool for page fetches instead of a pool per request; its
+# threads start lazily, so nothing is spawned before gunicorn forks workers.
+FETCH_POOL = ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix="serpapi")
+
+REDIS = Redis.from_url(REDIS_URL) if REDIS_URL else None
+# The Procfile worker uses SimpleWorker, which runs jobs in its own process
+# instead of forking per job, so LLM_CACHE / SEMANTIC_CACHE and the pooled
+# clients above persist across jobs in the worker.
+QUEUE = Queue("company-radar", connection=REDIS) if REDIS else None
+
+# On-disk cache of raw SerpAPI page bodies, shared by all workers on the host.
+SERP_CACHE = diskcache.Cache(SERP_CACHE_DIR, size_limit=200 * 2**20)
+
 # ---------- Helpers: time filter & sanitization ----------
+# Patterns are compiled once at import instead of going through re's cache per call.
+_RE_NON_WORD  = re.compile(r"[^a-z0-9]+")
+_RE_UL_OPEN   = re.compile(r"(?i)<ul\b")
+_RE_LI_OPEN   = re.compile(r"(?i)<li\b")
+_RE_ABS_DATE  = re.compile(r"([a-z]+)\.?\s+(\d{1,2}),\s+(\d{4})\s*$")
+
+# Relative units -> max count still inside the past week (None = any count).
+_AGO_UNITS = {
+    "minute": None, "minutes": None, "min": None, "mins": None,
+    "hour": None, "hours": None, "hr": None, "hrs": None,
+    "day": 7, "days": 7,
+    "week": 1, "weeks": 1,
+}
+# Keyed by the first three letters, so "Sep", "Sept" and "September" all resolve.
+_MONTHS = {
+    "jan": 1, "feb": 2, "mar": 3, "apr": 4, "may": 5, "jun": 6,
+    "jul": 7, "aug": 8, "sep": 9, "oct": 10, "nov": 11, "dec": 12,
+}
+
 def within_past_week(date_str: str) -> bool:
     if not date_str:
         return False
     s = date_str.strip().lower()
     if "yesterday" in s:
         return True
-    if re.match(r"\d+\s*(minute|min|minutes|mins)\s*ago", s):
-        return True
-    if re.match(r"\d+\s*(hour|hr|hours|hrs)\s*ago", s):
-        return True
-    m = re.match(r"(\d+)\s*(day|days)\s*ago", s)
-    if m:
-        return int(m.group(1)) <= 7
-    m = re.match(r"(\d+)\s*(week|weeks)\s*ago", s)
-    if m:
-        return int(m.group(1)) <= 1
+
+    # Relative ages like "5 mins ago", "3 days ago", "1week ago"
+    if s.endswith("ago"):
+        body = s[:-3].rstrip()
+        i = 0
+        while i < len(body) and "0" <= body[i] <= "9":
+            i += 1
+        if i:
+            unit = body[i:].lstrip()
+            if unit in _AGO_UNITS:
+                limit = _AGO_UNITS[unit]
+                return limit is None or int(body[:i]) <= limit
 
     # Absolute dates like "Oct 4, 2025", "October 4, 2025", "Oct. 4, 2025"
-    from datetime import datetime as dt
-    for fmt in ("%b %d, %Y", "%B %d, %Y", "%b. %d, %Y"):
-        try:
-            when = dt.strptime(date_str.strip(), fmt)
-            return (dt.now() - when).days <= 7
-        except ValueError:
-            pass
+    m = _RE_ABS_DATE.match(s)
+    if m:
+        month = _MONTHS.get(m.group(1)[:3])
+        year, day = int(m.group(3)), int(m.group(2))
+        if month and year >= datetime.min.year and 1 <= day <= calendar.monthrange(year, month)[1]:
+            return (datetime.now() - datetime(year, month, day)).days <= 7
     return False
 
+_ALLOWED_TAGS = frozenset({"ul", "li", "a", "strong", "em", "code", "br"})
+
+# libxml2 parses the fragment into a tree (so malformed markup is normalized
+# the way a browser would), then the cleaner drops everything off the allowlist.
+_CLEANER = Cleaner(
+    allow_tags=_ALLOWED_TAGS,
+    remove_unknown_tags=False,
+    safe_attrs_only=True,
+    safe_attrs=frozenset({"href"}),
+    javascript=True,
+    scripts=True,
+    style=True,
+    links=False,
+)
+
 def basic_sanitize_ul(html_fragment: str) -> str:
     """
     Very light allowlist: keep only <ul>, <li>, <a>, <strong>, <em>, <code>, <br>.
     Strip scripts & event handlers; block 'javascript:' URLs.
     Also ensure <a> has target="_blank" rel="noopener".
     """
-    if not html_fragment:
+    if not html_fragment or not html_fragment.strip():
         return "<ul></ul>"
-    s = html_fragment
-
-    # remove scripts and inline handlers
-    s = re.sub(r"(?is)<\s*script.*?>.*?<\s*/\s*script\s*>", "", s)
-    s = re.sub(r"(?is)\s+on\w+\s*=\s*(['\"]).*?\1", "", s)
-
-    # block javascript: URLs
-    s = re.sub(r'(?i)href\s*=\s*([\'"])\s*javascript:[^\'"]*\1', 'href="#"', s)
-
-    # allowlist tags
-    allowed = {"ul", "li", "a", "strong", "em", "code", "br"}
-    def keep_or_strip(m):
-        tag = m.group(1).lower()
-        return m.group(0) if tag in allowed else ""
-    s = re.sub(r"(?is)</?([a-z0-9]+)(?:\s[^>]*)?>", keep_or_strip, s)
-
-    # add target/rel to links
-    def fix_link(m):
-        tag = m.group(0)
-        # ensure target and rel
-        if 'target=' not in tag:
-            tag = tag[:-1] + ' target="_blank"' + ">"
-        if 'rel=' not in tag:
-            tag = tag[:-1] + ' rel="noopener"' + ">"
-        return tag
-    s = re.sub(r"(?i)<a\b([^>]*)>", lambda m: fix_link(m), s)
-    return s
+    tree = lxml_html.fragment_fromstring(html_fragment, create_parent="div")
+    _CLEANER(tree)
+    for a in tree.iter("a"):
+        if not a.get("href"):
+            a.set("href", "#")
+        a.set("target", "_blank")
+        a.set("rel", "noopener")
+    # strip the wrapper <div>…</div> added by create_parent
+    return lxml_html.tostring(tree, encoding="unicode")[5:-6]
 
 # ---------- Data fetch (SerpAPI Google Search – tbm=nws) ----------
+_TRACKERS = frozenset({
+    "utm_source", "utm_medium", "utm_campaign", "utm_term", "utm_content",
+    "gclid", "fbclid", "mc_cid", "mc_eid",
+})
+
+def _canon(url: str) -> str:
+    """
+    Dedup key for a news URL: lowercase host, no tracking params, no fragment
+    (unless it is a "#/..." client-side route). Only used for comparison, never
+    shown or linked; malformed URLs are compared as-is.
+    """
+    try:
+        parts = urlsplit(url)
+        query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                 if k.lower() not in _TRACKERS and not k.lower().startswith("utm_")]
+        fragment = parts.fragment if parts.fragment.startswith(("/", "!/")) else ""
+        return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path,
+                           urlencode(query, doseq=True), fragment))
+    except ValueError:
+        return url
+
 def fetch_and_clean_news(keyword: str, pages: int, num: int):
     """
     Use SerpAPI Google Search (News tab) with pagination, filter to past week.
     Return list of {title, snippet, url, source, date}.
     """
     base_url = "https://serpapi.com/search"
-    all_items, seen = [], set()
+    records, seen, seen_titles = [], set(), set()
+
+    def fetch_page(p):
+        # Raw page bodies are cached (not filtered items), so the past-week
+        # filter is still applied to cached pages on every request.
+        key = ("serpapi", keyword, p, num)
+        body = SERP_CACHE.get(key)
+        if body is not None:
+            return orjson.loads(body)
 
-    for p in range(pages):
         params = {
             "engine": "google",
             "tbm": "nws",
@@ -101,91 +230,285 @@ def fetch_and_clean_news(keyword: str, pages: int, num: int):
             "start": p * num,     # pagination
             "api_key": SERPAPI_KEY,
         }
-        r = requests.get(base_url, params=params, timeout=25)
+        r = http_session().get(base_url, params=params, timeout=SERP_TIMEOUT)
         r.raise_for_status()
-        data = r.json()
+        data = orjson.loads(r.content)
+        # only cache pages that parsed and are not SerpAPI error payloads
+        if isinstance(data, dict) and not data.get("error"):
+            SERP_CACHE.set(key, r.content, expire=SERP_CACHE_TTL)
+        return data
+
+    # pages are independent: fetch concurrently, then merge in page order
+    pages_data = list(FETCH_POOL.map(fetch_page, range(pages)))
 
+    # Filter and dedupe on the raw fields first; rows are kept as tuples and
+    # only turned into dicts once, for the items that survive.
+    for data in pages_data:
         results = data.get("news_results") or data.get("organic_results") or []
         for it in results:
-            title   = (it.get("title") or "").strip()
-            snippet = (it.get("snippet") or it.get("description") or "").strip()
-            url_    = (it.get("link") or "").strip()
-            src     = it.get("source")
-            source  = (src.get("name") if isinstance(src, dict) else (src or "")).strip()
-            date    = (it.get("date") or "").strip()
-
+            date = (it.get("date") or "").strip()
             if not within_past_week(date):
                 continue
-            if url_ and url_ in seen:
+            # same story under tracking-param variants or reprinted under another URL
+            url_ = (it.get("link") or "").strip()
+            url_key = _canon(url_) if url_ else ""
+            if url_key and url_key in seen:
                 continue
-            if url_:
-                seen.add(url_)
+            title = (it.get("title") or "").strip()
+            title_key = title.lower()[:80]
+            if title_key and title_key in seen_titles:
+                continue
+            if url_key:
+                seen.add(url_key)
+            if title_key:
+                seen_titles.add(title_key)
+
+            snippet = (it.get("snippet") or it.get("description") or "").strip()
             if title or snippet or url_:
-                all_items.append({
-                    "title": title,
-                    "snippet": snippet,
-                    "url": url_,
-                    "source": source,
-                    "date": date,
-                })
-    return all_items
+                src    = it.get("source")
+                source = (src.get("name") if isinstance(src, dict) else (src or "")).strip()
+                records.append((title, snippet, url_, source, date))
 
-# ---------- LLM formatting (one <ul> fragment) ----------
-def llm_ul_fragment(cleaned_items, keyword: str) -> str:
-    kw_lower = (keyword or "").lower()
-    startup_mode = any(k in kw_lower for k in [
-        "startup", "startups", "ai startup", "agentic ai", "founder",
-        "seed", "series a", "pre-seed", "pre seed"
-    ])
+    return [{"title": t, "snippet": s, "url": u, "source": o, "date": d}
+            for (t, s, u, o, d) in records]
+
+# ---------- LLM response cache ----------
+class LLMCache:
+    """
+    In-process TTL cache of sanitized <ul> fragments, keyed by a SHA-256 of
+    (model, keyword, items). Each gunicorn worker holds its own copy.
+    """
+    def __init__(self, maxsize: int, ttl: int):
+        self._data = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(model: str, keyword: str, cleaned_items) -> str:
+        items = sorted(cleaned_items, key=lambda x: (x.get("url", ""), x.get("title", "")))
+        payload = orjson.dumps({"model": model, "kw": keyword, "items": items},
+                               option=orjson.OPT_SORT_KEYS)
+        return hashlib.sha256(payload).hexdigest()
+
+    def get(self, key: str):
+        with self._lock:
+            value = self._data.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    def set(self, key: str, value: str) -> None:
+        with self._lock:
+            self._data[key] = value
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
+
+LLM_CACHE = LLMCache(maxsize=LLM_CACHE_SIZE, ttl=LLM_CACHE_TTL)
+
+def normalize_keyword(keyword: str) -> str:
+    return " ".join(_RE_NON_WORD.split((keyword or "").lower())).strip()
 
-    BASE_RULES = """
+def _jaccard(a: frozenset, b: frozenset) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+class SemanticCache:
+    """
+    Near-duplicate lookup for paraphrased keywords ("AI startup" vs "ai-startups").
+    A stored fragment is reused when the news URLs overlap (Jaccard) and the
+    keyword embeddings are close (cosine). The URL check runs first, so the
+    embedding API is only called when there is a plausible candidate.
+    """
+    def __init__(self, maxsize: int, ttl: int, min_sim: float, min_jaccard: float):
+        self._entries = TTLCache(maxsize=maxsize, ttl=ttl)   # (scope, norm_kw, urls) -> fragment
+        self._vectors = TTLCache(maxsize=maxsize * 2, ttl=ttl)  # norm_kw -> unit vector
+        self._lock = threading.Lock()
+        self.min_sim = min_sim
+        self.min_jaccard = min_jaccard
+        self.hits = 0
+        self.misses = 0
+
+    def _candidates(self, scope, url_set):
+        with self._lock:
+            return [(kw, frag) for (sc, kw, urls), frag in self._entries.items()
+                    if sc == scope and _jaccard(urls, url_set) >= self.min_jaccard]
+
+    def _vectors_for(self, keywords, embed):
+        with self._lock:
+            vecs = {k: self._vectors.get(k) for k in keywords}
+        missing = [k for k, v in vecs.items() if v is None]
+        if missing:
+            for k, v in zip(missing, embed(missing)):
+                norm = sum(x * x for x in v) ** 0.5 or 1.0
+                vecs[k] = [x / norm for x in v]
+            with self._lock:
+                for k in missing:
+                    self._vectors[k] = vecs[k]
+        return vecs
+
+    def _best_match(self, scope, keyword, url_set, embed):
+        candidates = self._candidates(scope, url_set)
+        if not candidates:
+            return None
+        norm_kw = normalize_keyword(keyword)
+        for kw, frag in candidates:
+            if kw == norm_kw:
+                return frag
+        try:
+            vecs = self._vectors_for({norm_kw, *(kw for kw, _ in candidates)}, embed)
+        except Exception:
+            # embeddings are best-effort; fall through to a real LLM call
+            return None
+        query = vecs[norm_kw]
+        best_sim, best_frag = 0.0, None
+        for kw, frag in candidates:
+            sim = sum(a * b for a, b in zip(query, vecs[kw]))
+            if sim > best_sim:
+                best_sim, best_frag = sim, frag
+        return best_frag if best_sim >= self.min_sim else None
+
+    def get(self, scope, keyword: str, url_set: frozenset, embed):
+        frag = self._best_match(scope, keyword, url_set, embed)
+        with self._lock:
+            if frag is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return frag
+
+    def set(self, scope, keyword: str, url_set: frozenset, fragment: str) -> None:
+        with self._lock:
+            self._entries[(scope, normalize_keyword(keyword), url_set)] = fragment
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+def embed_texts(texts):
+    # cache lookup only: fail fast and fall back to the model instead of stalling
+    resp = OAI.with_options(timeout=EMBED_TIMEOUT, max_retries=0).embeddings.create(
+        model=EMBED_MODEL, input=texts)
+    return [d.embedding for d in resp.data]
+
+SEMANTIC_CACHE = SemanticCache(maxsize=SEMANTIC_CACHE_SIZE, ttl=LLM_CACHE_TTL,
+                               min_sim=SEMANTIC_MIN_SIM, min_jaccard=SEMANTIC_MIN_JACC)
+
+# ---------- LLM prompts ----------
+# Instructions are fixed per startup-mode so every request sends a byte-identical
+# prefix, which OpenAI's automatic prompt caching can reuse. Only the keyword and
+# items (in the user input) vary between calls.
+ROLE = "You are an experienced, high-recall research analyst (covering VC, public equities, and industry).\n"
+BASE_RULES = """
 Return a STRICTLY VALID MINIMAL HTML FRAGMENT that is ONE <ul>…</ul> ONLY (no <html>, no <head>, no CSS/JS).
 
 Each <li> MUST follow exactly:
 <li><strong>Company or Startup Name</strong> — one-sentence summary (neutral, factual). <a href="URL">link</a></li>
 
+Input: a JSON array of news items with keys t=title, s=snippet, u=URL, o=source (publisher), d=date.
+A missing key means that field is empty.
+
 General approach (experienced analyst mindset):
 - Prioritize recall while keeping basic precision: extract as many materially relevant company/startup mentions as justified.
 - Accept fuzzy references when the name isn’t explicit (e.g., “<Founder or Place>’s <domain> startup (uncertain)”)—be concise and avoid speculation beyond title/snippet/source/date.
 - If multiple DISTINCT companies are clearly present in one item (partnerships, M&A, lawsuits), you MAY output up to 2 bullets from that item.
 - If a company appears in several items, de-duplicate by name and keep the clearest/most recent one.
-- When 'snippet' is empty, compose a concise one-sentence summary from title (+ optional source/date) only.
+- When the snippet is missing, compose a concise one-sentence summary from title (+ optional source/date) only.
 - If an item has no URL, omit the <a> tag entirely (never fabricate links).
 - Keep each bullet to ONE sentence; no emojis; no extra commentary.
 """
-    STARTUP_EMPHASIS = """
+STARTUP_EMPHASIS = """
 Startup emphasis:
 - Elevate AI/tech startups and emerging companies when relevant to the keyword.
 - From headlines like “<Famous alum> raises round for new venture”, infer a probable startup bullet even if the brand name is unclear; mark as (uncertain).
 """
-    COMPANY_EMPHASIS = """
+COMPANY_EMPHASIS = """
 Company emphasis:
 - Include public companies, large tech firms, and notable private companies tied to the user's theme.
 - In multi-company stories (e.g., partnerships, acquisitions), you may output up to 2 bullets if both entities are material.
 """
+OUTPUT = "\nOutput constraints: Output ONLY a single <ul>…</ul> block. Nothing before or after it."
 
-    system_prompt = (
-        "You are an experienced, high-recall research analyst (covering VC, public equities, and industry).\n"
-        + BASE_RULES
-        + (STARTUP_EMPHASIS if startup_mode else "")
-        + COMPANY_EMPHASIS
-        + "\nOutput constraints: Output ONLY a single <ul>…</ul> block. Nothing before or after it."
-    )
+# Interned so every request passes the very same string object.
+SYS_PROMPT_STARTUP = sys.intern(ROLE + BASE_RULES + STARTUP_EMPHASIS + COMPANY_EMPHASIS + OUTPUT)
+SYS_PROMPT_DEFAULT = sys.intern(ROLE + BASE_RULES + COMPANY_EMPHASIS + OUTPUT)
+
+# Several keywords in one call: same rules, one <ul> per numbered keyword group.
+BATCH_OUTPUT = """
+Batch mode: the input contains several numbered keyword groups. Apply all rules above to EACH group separately,
+using only that group's items, and wrap each group's <ul>…</ul> as <section data-kw="N">…</section> where N is the group number.
+Output constraints: Output ONLY the <section> blocks, one per group, in order. Nothing before, between or after them."""
+SYS_PROMPT_BATCH_STARTUP = sys.intern(ROLE + BASE_RULES + STARTUP_EMPHASIS + COMPANY_EMPHASIS + BATCH_OUTPUT)
+SYS_PROMPT_BATCH_DEFAULT = sys.intern(ROLE + BASE_RULES + COMPANY_EMPHASIS + BATCH_OUTPUT)
 
-    client = OpenAI(api_key=OPENAI_API_KEY)
+# ---------- LLM formatting (one <ul> fragment) ----------
+def compact_items(cleaned_items):
+    """
+    Shrink items for the prompt: one-letter keys (legend in the system prompt),
+    empty fields omitted, long snippets truncated.
+    """
+    compact = []
+    for x in cleaned_items:
+        if not (x["title"] or x["snippet"]):
+            continue
+        row = {"t": x["title"], "s": x["snippet"][:300], "u": x["url"], "o": x["source"], "d": x["date"]}
+        compact.append({k: v for k, v in row.items() if v})
+    return compact
+
+def is_startup_keyword(keyword: str) -> bool:
+    kw_lower = (keyword or "").lower()
+    return any(k in kw_lower for k in [
+        "startup", "startups", "ai startup", "agentic ai", "founder",
+        "seed", "series a", "pre-seed", "pre seed"
+    ])
+
+def pick_model(payload: bytes) -> str:
+    """Route small inputs (rough estimate: 4 bytes per token) to the cheaper model."""
+    return LLM_SMALL_MODEL if len(payload) // 4 < LLM_SMALL_MAX_TOKENS else LLM_MODEL
+
+def build_prompt(payload: bytes, keyword: str, startup_mode: bool):
+    """Return (instructions, user_input) for one keyword's compacted items."""
+    system_prompt = SYS_PROMPT_STARTUP if startup_mode else SYS_PROMPT_DEFAULT
     user_input = (
         "Task: From the following news items, extract as many distinct company/startup bullets as are materially relevant, "
         "following the rules and format strictly. Use source/date to help write a neutral one-liner if snippet is missing. "
         f"User keyword/theme: {keyword}\n\n"
-        + json.dumps(cleaned_items, ensure_ascii=False, indent=2)
+        + payload.decode()
     )
+    return system_prompt, user_input
 
-    resp = client.responses.create(
-        model="gpt-5",
-        instructions=system_prompt,
-        input=user_input,
-    )
+def direct_fragment(compact) -> str:
+    """Bullets for tiny inputs, templated straight from the compacted items."""
+    if not compact:
+        return "<ul></ul>"
+    lis = []
+    for x in compact:
+        head = x.get("t") or x.get("s")
+        summary = (x.get("s") if x.get("t") else "") or ", ".join(v for v in (x.get("o"), x.get("d")) if v)
+        li = f"<li><strong>{escape(head)}</strong>"
+        if summary:
+            li += f" — {escape(summary)}"
+        if x.get("u"):
+            li += f' <a href="{escape(x["u"])}">link</a>'
+        lis.append(li + "</li>")
+    return basic_sanitize_ul("<ul>\n" + "\n".join(lis) + "\n</ul>")
+
+def finalize_fragment(html_fragment: str) -> str:
+    """Coerce raw model text into one sanitized <ul>."""
+    frag = (html_fragment or "").strip()
+    if not _RE_UL_OPEN.search(frag):
+        lines = [ln.strip("-• \t") for ln in frag.splitlines() if ln.strip()]
+        items = "".join(f"<li>{ln}</li>" for ln in lines)
+        frag = f"<ul>\n{items}\n</ul>"
+    return basic_sanitize_ul(frag)
 
+def response_text(resp) -> str:
+    """Output text of a Responses API result, or "" if it carried none."""
     html_fragment = getattr(resp, "output_text", None)
     if not html_fragment:
         chunks = []
@@ -194,15 +517,142 @@ Company emphasis:
                 for c in item.get("content", []):
                     if c.get("type") == "output_text" and "text" in c:
                         chunks.append(c["text"])
-        html_fragment = "\n".join(chunks) if chunks else str(resp)
+        html_fragment = "\n".join(chunks)
+    return html_fragment or ""
 
-    frag = (html_fragment or "").strip()
-    if "<ul" not in frag.lower():
-        lines = [ln.strip("-• \t") for ln in frag.splitlines() if ln.strip()]
-        items = "".join(f"<li>{ln}</li>" for ln in lines)
-        frag = f"<ul>\n{items}\n</ul>"
+def response_ok(resp, text: str) -> bool:
+    """Only completed responses with real output are worth caching."""
+    return getattr(resp, "status", None) == "completed" and bool(text.strip())
 
-    return basic_sanitize_ul(frag)
+class LLMCall:
+    """
+    One <ul> request for (items, keyword): cache lookups, prompt, and storing
+    the sanitized result. Shared by the blocking and streaming paths.
+    """
+    def __init__(self, cleaned_items, keyword: str):
+        self.cleaned_items = cleaned_items
+        self.keyword = keyword
+        self.compact = compact_items(cleaned_items)
+        self.payload = orjson.dumps(self.compact)
+        self.model = pick_model(self.payload)
+        self.startup_mode = is_startup_keyword(keyword)
+        self.cache_key = LLMCache.make_key(self.model, keyword, cleaned_items)
+        self.scope = (self.model, self.startup_mode)
+        self.url_set = frozenset(x["url"] for x in cleaned_items if x.get("url"))
+
+    def lookup(self):
+        """Fragment that needs no model call (tiny input or a cache hit), else None."""
+        if len(self.compact) <= LLM_DIRECT_MAX_ITEMS:
+            return direct_fragment(self.compact)
+        frag = LLM_CACHE.get(self.cache_key)
+        if frag is None:
+            frag = SEMANTIC_CACHE.get(self.scope, self.keyword, self.url_set, embed_texts)
+            if frag is not None:
+                LLM_CACHE.set(self.cache_key, frag)
+        return frag
+
+    def request_kwargs(self) -> dict:
+        instructions, user_input = build_prompt(self.payload, self.keyword, self.startup_mode)
+        return {"model": self.model, "instructions": instructions, "input": user_input}
+
+    def store(self, html_fragment: str) -> str:
+        frag = finalize_fragment(html_fragment)
+        LLM_CACHE.set(self.cache_key, frag)
+        SEMANTIC_CACHE.set(self.scope, self.keyword, self.url_set, frag)
+        return frag
+
+def complete(call: LLMCall) -> str:
+    resp = OAI.responses.create(**call.request_kwargs())
+    text = response_text(resp)
+    if not response_ok(resp, text):
+        # incomplete/filtered: show what came back once, but never cache it
+        return finalize_fragment(text or str(resp))
+    return call.store(text)
+
+def llm_ul_fragment(cleaned_items, keyword: str) -> str:
+    call = LLMCall(cleaned_items, keyword)
+    ready = call.lookup()
+    if ready is not None:
+        return ready
+    return complete(call)
+
+_RE_SECTION = re.compile(r"""(?is)<section\b[^>]*?\bdata-kw\s*=\s*["']?(\d+)[^>]*>(.*?)</section\s*>""")
+
+def build_batch_input(calls) -> str:
+    parts = [
+        "Task: For EACH keyword group below, extract as many distinct company/startup bullets as are materially relevant, "
+        "following the rules and format strictly. Use source/date to help write a neutral one-liner if snippet is missing."
+    ]
+    for n, call in enumerate(calls, 1):
+        parts.append(f"Keyword group {n} — user keyword/theme: {call.keyword}\n{call.payload.decode()}")
+    return "\n\n".join(parts)
+
+def llm_ul_fragments(items_by_keyword) -> list:
+    """
+    Batched llm_ul_fragment for [(cleaned_items, keyword), ...]: returns one <ul>
+    per pair. Keywords that miss every cache are grouped by scope (model and
+    startup mode) and each group shares one model call, so every section is
+    produced with exactly the prompt and model its own cache key stands for.
+    Any group member missing from the batched answer (or with no <li>, or from
+    an incomplete response) is retried on its own.
+    """
+    calls = [LLMCall(items, kw) for items, kw in items_by_keyword]
+    frags = [call.lookup() for call in calls]
+    groups = {}
+    for i, frag in enumerate(frags):
+        if frag is None:
+            groups.setdefault(calls[i].scope, []).append(i)
+
+    for (model, startup_mode), pending in groups.items():
+        if len(pending) == 1:
+            frags[pending[0]] = complete(calls[pending[0]])
+            continue
+        resp = OAI.responses.create(
+            model=model,
+            instructions=SYS_PROMPT_BATCH_STARTUP if startup_mode else SYS_PROMPT_BATCH_DEFAULT,
+            input=build_batch_input([calls[i] for i in pending]),
+        )
+        text = response_text(resp)
+        # an incomplete batch may hold cut-off sections: retry everyone alone instead
+        sections = {} if not response_ok(resp, text) else {
+            int(n): body for n, body in _RE_SECTION.findall(text) if _RE_LI_OPEN.search(body)
+        }
+        for n, i in enumerate(pending, 1):
+            frags[i] = calls[i].store(sections[n]) if n in sections else complete(calls[i])
+    return frags
+
+_RE_LI = re.compile(r"(?is)<li\b.*?</li\s*>")
+
+def llm_ul_stream(cleaned_items, keyword: str):
+    """
+    Streaming variant of llm_ul_fragment. Yields ("li", html) for each bullet
+    as soon as its </li> arrives, then ("done", fragment) with the full
+    sanitized <ul>. Only a stream that ends in response.completed is cached.
+    """
+    call = LLMCall(cleaned_items, keyword)
+    ready = call.lookup()
+    if ready is not None:
+        yield "done", ready
+        return
+
+    buf, pos, completed = "", 0, False
+    for event in OAI.responses.create(**call.request_kwargs(), stream=True):
+        if event.type == "response.output_text.delta":
+            buf += event.delta
+            for m in _RE_LI.finditer(buf, pos):
+                yield "li", basic_sanitize_ul(m.group(0))
+                pos = m.end()
+        elif event.type == "response.completed":
+            completed = True
+        elif event.type == "response.failed":
+            raise RuntimeError(f"LLM stream failed: {event.response.error}")
+        elif event.type == "error":
+            raise RuntimeError(event.message)
+    if completed and buf.strip():
+        yield "done", call.store(buf)
+    else:
+        # incomplete or cut-off stream: show the partial list once, don't cache it
+        yield "done", finalize_fragment(buf)
 
 # ---------- Routes ----------
 @app.get("/")
@@ -210,33 +660,132 @@ def home():
     # First render with default keyword (AI Startup)
     return render_template("index.html", keyword="AI Startup", ul_fragment=None, meta=None, error=None)
 
+def read_params(values):
+    keywords = []
+    for raw in values.getlist("keyword"):
+        for kw in raw.split(";"):
+            kw = kw.strip()
+            if kw and kw not in keywords:
+                keywords.append(kw)
+    keywords = keywords[:MAX_KEYWORDS] or ["AI Startup"]
+    pages  = max(1, min(MAX_PAGES, int(values.get("pages") or DEFAULT_PAGES)))
+    num    = max(1, min(MAX_NUM, int(values.get("num") or DEFAULT_NUM)))
+    return keywords, pages, num
+
+def build_meta(keyword: str, pages: int, num: int, count: int, t0: float) -> dict:
+    return {
+        "count": count,
+        "generated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "duration_sec": round(time.time() - t0, 2),
+        "pages": pages,
+        "num": num,
+        "keyword": keyword,
+    }
+
+def run_generate(keywords, pages: int, num: int) -> dict:
+    """
+    Fetch + format one report (one <ul> per keyword). Runs in the request
+    (dev mode) or in an RQ worker.
+    """
+    t0 = time.time()
+    if len(keywords) == 1:
+        cleaned = fetch_and_clean_news(keywords[0], pages=pages, num=num)
+        ul = llm_ul_fragment(cleaned, keywords[0])
+        return {"html": ul, "meta": build_meta(keywords[0], pages, num, len(cleaned), t0)}
+
+    # Not FETCH_POOL: each fetch_and_clean_news already fans its pages out there.
+    with ThreadPoolExecutor(max_workers=len(keywords)) as ex:
+        cleaned_lists = list(ex.map(lambda kw: fetch_and_clean_news(kw, pages=pages, num=num), keywords))
+    frags = llm_ul_fragments(list(zip(cleaned_lists, keywords)))
+    html_ = "\n".join(f"<section><h3>{escape(kw)}</h3>\n{frag}</section>" for kw, frag in zip(keywords, frags))
+    count = sum(len(cleaned) for cleaned in cleaned_lists)
+    return {"html": html_, "meta": build_meta("; ".join(keywords), pages, num, count, t0)}
+
+@app.context_processor
+def inject_queue_mode():
+    return {"queue_mode": QUEUE is not None}
+
 @app.post("/generate")
 def generate():
     try:
-        keyword = (request.form.get("keyword") or "AI Startup").strip() or "AI Startup"
-        pages  = int(request.form.get("pages") or DEFAULT_PAGES)
-        num    = int(request.form.get("num") or DEFAULT_NUM)
-
-        t0 = time.time()
-        cleaned = fetch_and_clean_news(keyword, pages=pages, num=num)
-        ul = llm_ul_fragment(cleaned, keyword)
-        t1 = time.time()
-
-        meta = {
-            "count": len(cleaned),
-            "generated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "duration_sec": round(t1 - t0, 2),
-            "pages": pages,
-            "num": num,
-            "keyword": keyword,
-        }
-        return render_template("index.html", keyword=keyword, ul_fragment=Markup(ul), meta=meta, error=None)
+        keywords, pages, num = read_params(request.form)
+        keyword = "; ".join(keywords)
+
+        if QUEUE is not None:
+            job = QUEUE.enqueue(run_generate, keywords, pages, num,
+                                job_timeout=JOB_TIMEOUT, result_ttl=JOB_TTL)
+            if request.accept_mimetypes.best == "application/json":
+                return {"job_id": job.id}
+            return render_template("index.html", keyword=keyword, ul_fragment=None, meta=None, error=None,
+                                   job_id=job.id, job_timeout=JOB_TIMEOUT)
+
+        result = run_generate(keywords, pages, num)
+        return render_template("index.html", keyword=keyword, ul_fragment=Markup(result["html"]),
+                               meta=result["meta"], error=None)
     except Exception as e:
         return render_template("index.html", keyword="AI Startup", ul_fragment=None, meta=None, error=str(e))
 
+@app.get("/result/<job_id>")
+def result(job_id):
+    if REDIS is None:
+        return {"status": "unknown", "error": "Job queue is not enabled."}, 404
+    try:
+        job = Job.fetch(job_id, connection=REDIS)
+    except NoSuchJobError:
+        return {"status": "unknown", "error": "Job not found or expired."}, 404
+
+    status = job.get_status()
+    if status == "finished":
+        return {"status": "finished", **job.return_value()}
+    if status == "failed":
+        latest = job.latest_result()
+        lines = ((latest and latest.exc_string) or "").strip().splitlines()
+        return {"status": "failed", "error": lines[-1] if lines else "Job failed."}
+    status = str(getattr(status, "value", status))
+    if status in ("stopped", "canceled"):
+        return {"status": status, "error": f"Job was {status}."}
+    return {"status": status}
+
+def sse(data: str, event: str = None) -> str:
+    lines = [f"event: {event}"] if event else []
+    lines += [f"data: {ln}" for ln in data.split("\n")]
+    return "\n".join(lines) + "\n\n"
+
+@app.get("/generate_stream")
+def generate_stream():
+    """
+    Server-Sent Events version of /generate: one unnamed event per sanitized
+    <li> as the model writes it, then a "done" event carrying the final <ul>
+    and meta as JSON, or a "failure" event with the error message.
+    Several keywords are answered by one batched call, so only "done" is sent.
+    """
+    def events():
+        try:
+            keywords, pages, num = read_params(request.args)
+            if len(keywords) > 1:
+                yield sse(orjson.dumps(run_generate(keywords, pages, num)).decode(), event="done")
+                return
+            keyword = keywords[0]
+
+            t0 = time.time()
+            cleaned = fetch_and_clean_news(keyword, pages=pages, num=num)
+            for kind, html_ in llm_ul_stream(cleaned, keyword):
+                if kind == "li":
+                    yield sse(html_)
+                else:
+                    ul = html_
+
+            meta = build_meta(keyword, pages, num, len(cleaned), t0)
+            yield sse(orjson.dumps({"html": ul, "meta": meta}).decode(), event="done")
+        except Exception as e:
+            yield sse(str(e), event="failure")
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(stream_with_context(events()), mimetype="text/event-stream", headers=headers)
+
 @app.get("/healthz")
 def healthz():
-    return {"ok": True}
+    return {"ok": True, "llm_cache": LLM_CACHE.stats(), "semantic_cache": SEMANTIC_CACHE.stats()}
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=int(os.getenv("PORT", "8000")), debug=True)